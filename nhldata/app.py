@@ -9,26 +9,169 @@ automomously.  So feel free to add anywhere (not hinted, this is where we see yo
     * messaging for monitoring or troubleshooting
     * anything else you think is necessary to have for restful nights
 """
+import csv
+import gzip
+import hashlib
 import logging
-from io import StringIO
-from typing import Dict, List, Tuple
-from datetime import datetime
+import os
+import tempfile
+import threading
+import time
+from io import BytesIO, TextIOWrapper
+from collections import deque
+from typing import BinaryIO, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+from datetime import datetime, timedelta
+from functools import lru_cache
 from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 import boto3
 import requests
 import pandas as pd
+from boto3.s3.transfer import TransferConfig
 from botocore.config import Config
+from botocore.exceptions import ClientError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:  # orjson is only a speedup, the stdlib decoder also accepts bytes
+    import json as orjson
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # only needed for --format parquet
+    pa = pq = None
 
 logging.basicConfig(level=logging.INFO)
 LOG = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=1024)
+def _api_date(value: str) -> str:
+    """Validates a date returned by the api and renders it as YYYY-MM-DD
+
+    Cached since every game of a date repeats the same value.
+
+    Args:
+        value: api date
+
+    Returns:
+        Formatted date
+    """
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except (TypeError, ValueError) as error:
+        raise ValueError(f'Unexpected date={value} from the api') from error
+
+
+_COLUMN_SANITIZER = str.maketrans({'.': '_'})
+
+
+@lru_cache(maxsize=4096)
+def _column_name(prefix: str, key: str) -> str:
+    """Renders the flattened column name of a nested key, ie (player_person, fullName) -> player_person_fullName
+
+    Cached since every player repeats the same keys, which also lets all rows share one string per column.
+
+    Args:
+        prefix: column name of the parent level, empty for the top level
+        key: key within the parent level
+
+    Returns:
+        Column name, with any `.` in api keys replaced by `_`
+    """
+    if prefix:
+        return f'{prefix}_{key.translate(_COLUMN_SANITIZER)}'
+    # side is added by the crawler rather than the api so it is not a player_ column
+    return key if key == 'side' else f'player_{key.translate(_COLUMN_SANITIZER)}'
+
+
+def _flatten(record: Dict, prefix: str, out: Dict) -> Dict:
+    """Flattens a nested dict into `out` with `_` joined keys, ie person.fullName -> player_person_fullName
+
+    Scalars are emitted before nested dicts at each level so the column order matches pd.json_normalize.
+
+    Args:
+        record: nested dict to flatten
+        prefix: key prefix of the current level, empty for the top level
+        out: dict the flattened values are written into
+
+    Returns:
+        out
+    """
+    nested = []
+    for k, v in record.items():
+        key = _column_name(prefix, k)
+        if isinstance(v, dict):
+            nested.append((key, v))
+        else:
+            out[key] = v
+    for key, v in nested:
+        _flatten(v, key, out)
+    return out
+
+
+class RateLimiter:
+    """Token bucket shared by every thread, allows bursts of up to `rate` calls and `rate` calls per second after"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Takes a token, sleeping until it is available"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # reserve the token right away so callers queue up instead of racing for the next one
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
 class NHLApi:
     SCHEMA_HOST = "https://statsapi.web.nhl.com/"
     VERSION_PREFIX = "api/v1"
 
-    def __init__(self, base=None):
+    def __init__(self, base=None, pool_size: int = 32, cache_dir: Optional[str] = None, rate_limit: float = 20):
         self.base = base if base else f'{self.SCHEMA_HOST}/{self.VERSION_PREFIX}'
+        # urls only depend on the base, so they are rendered once rather than per request
+        self._schedule_url = self._url('schedule')
+        self._boxscore_tmpl = self._url('game/%s/boxscore')
+        # requests per second across all threads, stays under the api's throttling instead of retrying into it
+        self._limiter = RateLimiter(rate_limit)
+        # responses are cached on disk when set so a rerun of a failed crawl doesn't fetch everything again.
+        # only responses that can't change anymore are cached: schedules of past dates whose games are all final,
+        # and boxscores of games a schedule reported as final
+        self._cache_dir = Path(cache_dir) if cache_dir else None
+        if self._cache_dir:
+            self._cache_dir.mkdir(parents=True, exist_ok=True)
+        self._final_games = set()
+        # one keep-alive pool shared by every request, retrying throttling and server errors with backoff.
+        # pool_size should be at least the number of concurrent callers or connections get dropped after use
+        retry = Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                      respect_retry_after_header=True)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self._session = requests.Session()
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+
+    def close(self):
+        """Closes the pooled connections"""
+        self._session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
     def schedule(self, start_date: datetime, end_date: datetime) -> dict:
         """
@@ -44,8 +187,48 @@ class NHLApi:
                 ...
             ]
         """
-        return self._get(self._url('schedule'),
-                         {'startDate': start_date.strftime('%Y-%m-%d'), 'endDate': end_date.strftime('%Y-%m-%d')})
+        # today's and future dates still change, past dates can still list games that aren't final (ie postponed)
+        settled = end_date.date() < datetime.now().date()
+        schedule = self._get(self._schedule_url,
+                             {'startDate': start_date.strftime('%Y-%m-%d'), 'endDate': end_date.strftime('%Y-%m-%d')},
+                             cache_when=self._all_final if settled else None)
+        self._final_games.update(game.get('gamePk') for schedule_date in schedule.get('dates', [])
+                                 for game in schedule_date.get('games', []) if self._is_final(game))
+        return schedule
+
+    @staticmethod
+    def _is_final(game: Dict) -> bool:
+        """whether a schedule game is over, its boxscore won't change anymore"""
+        return game.get('status', {}).get('abstractGameState') == 'Final'
+
+    def _all_final(self, schedule: Dict) -> bool:
+        """whether every game of a schedule is over"""
+        return all(self._is_final(game) for schedule_date in schedule.get('dates', [])
+                   for game in schedule_date.get('games', []))
+
+    def iter_schedule_dates(self, start_date: datetime, end_date: datetime, chunk_days: int = 7):
+        """
+        yields the "dates" entries of schedule in order. ranges of chunk_days or more are requested as concurrent
+        chunk_days windows and their dates are yielded as soon as the window holding them arrives, so callers can
+        start on the first games while later windows are still downloading. shorter ranges, like the default one
+        day crawl, are a single schedule request that has to finish before anything is yielded
+        """
+        if (end_date - start_date).days < chunk_days:
+            yield from self.schedule(start_date=start_date, end_date=end_date).get('dates', [])
+            return
+
+        # start and end dates are both inclusive, so windows must not share a day
+        windows = []
+        window_start = start_date
+        while window_start <= end_date:
+            window_end = min(window_start + timedelta(days=chunk_days - 1), end_date)
+            windows.append((window_start, window_end))
+            window_start = window_end + timedelta(days=1)
+
+        with ThreadPoolExecutor(max_workers=min(len(windows), 8)) as executor:
+            schedules = executor.map(lambda window: self.schedule(start_date=window[0], end_date=window[1]), windows)
+            for schedule in schedules:
+                yield from schedule.get('dates', [])
 
     def boxscore(self, game_id):
         """
@@ -83,14 +266,41 @@ class NHLApi:
 
             See tests/resources/boxscore.json for a real example response
         """
-        url = self._url(f'game/{game_id}/boxscore')
-        return self._get(url)
+        # only games a schedule reported as final are cacheable, live or unplayed boxscores still change
+        return self._get(self._boxscore_tmpl % game_id,
+                         cache_when=(lambda boxscore: True) if game_id in self._final_games else None)
 
-    def _get(self, url, params=None):
-        response = requests.get(url, params=params, timeout=60)
-        LOG.info(f'Sending get request to {url}')
+    def _get(self, url, params=None, cache_when: Optional[Callable[[Dict], bool]] = None):
+        """
+        GETs and decodes a json response. With a cache_dir, cache_when decides whether the response can be cached,
+        None keeps the request away from the cache entirely
+        """
+        cache_path = self._cache_path(url, params) if cache_when else None
+        if cache_path and cache_path.exists():
+            LOG.info('Reading cached response for %s', url)
+            return orjson.loads(gzip.decompress(cache_path.read_bytes()))
+
+        self._limiter.acquire()
+        response = self._session.get(url, params=params, timeout=60)
+        LOG.info('Sending get request to %s', url)
         response.raise_for_status()
-        return response.json()
+        content = response.content
+        data = orjson.loads(content)
+
+        if cache_path and cache_when(data):
+            # write then rename so a crash can't leave a truncated entry behind, the temp file is unique per call
+            # since worker threads fetching the same url share a pid
+            with tempfile.NamedTemporaryFile(dir=self._cache_dir, suffix='.tmp', delete=False) as tmp_file:
+                tmp_file.write(gzip.compress(content))
+            os.replace(tmp_file.name, cache_path)
+        return data
+
+    def _cache_path(self, url, params=None) -> Optional[Path]:
+        """returns the cache file of a request, keyed by the sha256 of its url and params"""
+        if not self._cache_dir:
+            return None
+        digest = hashlib.sha256(f'{url}?{sorted((params or {}).items())}'.encode()).hexdigest()
+        return self._cache_dir / f'{digest}.json.gz'
 
     def _url(self, path):
         return f'{self.base}/{path}'
@@ -98,15 +308,17 @@ class NHLApi:
 
 @dataclass
 class StorageKey:
-    # TODO what properties are needed to partition?
-    # I don't think it makes sense so create seperate files for additional fields
+    # keys are hive style partitioned by date so a date can be listed, pruned or backfilled by prefix
     # TODO store primary keys in configuration file and use them in sql files
-    gameid: str
+    date: str
+    gameid: Optional[str] = None
+    fmt: str = 'csv'
 
     def key(self):
-        """ renders the s3 key for the given set of properties """
-        # TODO use the properties to return the s3 key
-        return f'{self.gameid}.csv'
+        """ renders the s3 key for the given set of properties, a key without a game holds the whole date """
+        if self.gameid is None:
+            return f'date={self.date}/players.{self.fmt}'
+        return f'date={self.date}/game={self.gameid}.{self.fmt}'
 
 
 class Storage:
@@ -119,32 +331,84 @@ class Storage:
         """
         self._s3_client = s3_client
         self.bucket = dest_bucket
+        # payloads over the threshold are split into parts that are uploaded in parallel
+        self._transfer_config = TransferConfig(multipart_threshold=8 * 1024 * 1024, max_concurrency=10,
+                                               multipart_chunksize=8 * 1024 * 1024, use_threads=True)
 
-    def store_game(self, key: StorageKey, game_data) -> bool:
-        """Converts start_date and end_date into datetimes
+    def store_game(self, key: StorageKey, game_data: BinaryIO) -> bool:
+        """Uploads a game's data to the destination bucket, streaming it from the file object
 
         Args:
-            start_date: start date
-            end_date: end date
+            key: storage key of the game
+            game_data: binary file object with the serialized game data
 
         Returns:
-            Formatted datetimes
+            True once stored
         """
-        self._s3_client.put_object(Bucket=self.bucket, Key=key.key(), Body=game_data)
-        LOG.info(f'Storing key={key.key()} in {self.bucket}')
+        if self._stored_etag(key) == self._md5(game_data):
+            LOG.info('Skipping key=%s in %s, already stored', key.key(), self.bucket)
+            return True
+
+        self._s3_client.upload_fileobj(Fileobj=game_data, Bucket=self.bucket, Key=key.key(),
+                                       Config=self._transfer_config)
+        LOG.info('Storing key=%s in %s', key.key(), self.bucket)
         return True
 
+    @staticmethod
+    def _md5(game_data: BinaryIO) -> str:
+        """md5 hex digest of a file object, read in chunks and rewound afterwards"""
+        digest = hashlib.md5()
+        game_data.seek(0)
+        for chunk in iter(lambda: game_data.read(1024 * 1024), b''):
+            digest.update(chunk)
+        game_data.seek(0)
+        return digest.hexdigest()
+
+    def _stored_etag(self, key: StorageKey) -> Optional[str]:
+        """Looks up the ETag of an already stored key
+
+        Single part uploads have the md5 of the body as ETag, multipart ETags never match one so those are
+        always uploaded again.
+
+        Args:
+            key: storage key of the game
+
+        Returns:
+            ETag without quotes, None when the key doesn't exist or can't be checked
+        """
+        try:
+            response = self._s3_client.head_object(Bucket=self.bucket, Key=key.key())
+        except ClientError as error:
+            code = error.response.get('Error', {}).get('Code')
+            if code not in ('404', 'NoSuchKey', 'NotFound'):
+                # ie 403 for a missing key when the role can't s3:ListBucket, the upload decides instead
+                LOG.warning('Could not check key=%s in %s (%s), uploading', key.key(), self.bucket, code)
+            return None
+        return response['ETag'].strip('"')
+
 
 class Crawler:
-    def __init__(self, api: NHLApi, storage: Storage):
+    FORMATS = ('csv', 'parquet')
+    # parquet uploads run on their own pool, the fetch pool's FIFO queue would hold them until every fetch started
+    UPLOAD_WORKERS = 4
+
+    def __init__(self, api: NHLApi, storage: Storage, max_workers: int = 16, output_format: str = 'csv'):
         """Initializes Crawler class
 
         Args:
             api: API endpoint
             storage: Storage client
+            max_workers: number of boxscores fetched concurrently
+            output_format: csv stores one object per game, parquet stores one object per date
         """
+        if output_format not in self.FORMATS:
+            raise ValueError(f'output_format must be one of {self.FORMATS}')
+        if output_format == 'parquet' and pq is None:
+            raise ValueError('pyarrow is required for parquet output')
         self.api = api
         self.storage = storage
+        self.max_workers = max_workers
+        self.output_format = output_format
 
     def parse_player_data(self, player_data: List[Dict]) -> "DataFrame":
         """Converts start_date and end_date into datetimes
@@ -155,13 +419,7 @@ class Crawler:
         Returns:
             Cleaned player data as DataFrame
         """
-        player_data_df = pd.json_normalize(player_data)
-        player_data_df = player_data_df.add_prefix('player_')
-        player_data_df = player_data_df.rename(columns={'player_side': 'side'})
-        player_data_df = player_data_df.rename(columns=lambda col: col.replace('.', '_'))
-        player_data_df = player_data_df.astype(object).where(pd.notnull(player_data_df), None)
-
-        return player_data_df
+        return pd.DataFrame(self._to_columns(self._player_rows(player_data)))
 
     def create_game_stats(self, game_data: Dict) -> "DataFrame":
         """Converts start_date and end_date into datetimes
@@ -172,14 +430,193 @@ class Crawler:
         Returns:
             Cleaned player data as DataFrame
         """
+        return self.parse_player_data(self._skaters(game_data))
+
+    def _skaters(self, game_data: Dict) -> List[Dict]:
+        """Collects the non goalie players of both teams, tagged with their side
+
+        Args:
+            game_data: boxscore of a game
+
+        Returns:
+            List of player data
+        """
         player_data = []
-        for team in game_data.get('teams'):
-            for player in game_data['teams'][team]['players'].values():
-                if 'Goalie' != player['person']['primaryPosition']['name']:  # ignore goalies
-                    player['side'] = team
-                    player_data.append(player)
+        for side, team in game_data['teams'].items():
+            for player in team['players'].values():
+                if player['person']['primaryPosition']['name'] == 'Goalie':  # ignore goalies
+                    continue
+                player['side'] = side
+                player_data.append(player)
+
+        return player_data
 
-        return self.parse_player_data(player_data)
+    def _player_rows(self, player_data: List[Dict]) -> List[Dict]:
+        """Flattens player data into csv rows
+
+        Args:
+            player_data: List of player data
+
+        Returns:
+            List of flat player rows
+        """
+        return [_flatten(player, '', {}) for player in player_data]
+
+    def _to_columns(self, players: List[Dict]) -> Dict[str, List]:
+        """Transposes flat player rows into columns, in first seen order
+
+        Rows don't all carry every column (ie no skaterStats), missing values are None.
+
+        Args:
+            players: List of flat player rows
+
+        Returns:
+            column name -> list of values, one per player
+        """
+        columns = {}
+        for i, player in enumerate(players):
+            for col, value in player.items():
+                column = columns.get(col)
+                if column is None:
+                    column = columns[col] = [None] * len(players)
+                column[i] = value
+        return columns
+
+    def _write_csv(self, players: List[Dict], buf) -> None:
+        """Writes flat player rows as csv, with a header of every column in first seen order
+
+        Args:
+            players: List of flat player rows
+            buf: text buffer to write to
+        """
+        columns = self._to_columns(players)
+        writer = csv.writer(buf, lineterminator='\n')  # same line endings as the DataFrame.to_csv files
+        writer.writerow(columns)
+        writer.writerows(zip(*columns.values()))
+
+    def _write_parquet(self, players: List[Dict], buf) -> None:
+        """Writes flat player rows as a zstd compressed parquet table
+
+        Args:
+            players: List of flat player rows
+            buf: binary buffer to write to
+        """
+        pq.write_table(pa.Table.from_pydict(self._to_columns(players)), buf, compression='zstd')
+
+    def _submit_games(self, executor: ThreadPoolExecutor, start_date: datetime, end_date: datetime,
+                      task: Callable) -> Deque[Tuple]:
+        """Submits a task for every scheduled game while the schedule is still being fetched
+
+        Args:
+            executor: executor the tasks run on
+            start_date: start date
+            end_date: end date
+            task: called with the date and game id of each game
+
+        Returns:
+            Queue of (date, game id, task future) in schedule order
+        """
+        games = deque()
+        for schedule_date in self.api.iter_schedule_dates(start_date=start_date, end_date=end_date):
+            date = _api_date(schedule_date.get('date'))
+            LOG.info('Fetching %s games from %s', len(schedule_date.get('games')), date)
+            if LOG.isEnabledFor(logging.DEBUG):
+                LOG.debug('Schedule for %s: %s', date, schedule_date)
+            for game in schedule_date.get('games'):
+                games.append((date, game.get('gamePk'), executor.submit(task, date, game.get('gamePk'))))
+        return games
+
+    def _results(self, games: Deque[Tuple], failures: List[Tuple]) -> Iterator[Tuple]:
+        """Yields (date, game id, task result) in schedule order, skipping failed games
+
+        Each future is popped off the queue as it is consumed so its result, ie a whole boxscore, can be freed
+        instead of living until the crawl ends.
+
+        Args:
+            games: queue of (date, game id, task future) from _submit_games
+            failures: (date, game id) of every failed game is appended here, the task already logged why
+        """
+        while games:
+            date, game_id, future = games.popleft()
+            try:
+                result = future.result()
+            except Exception:
+                failures.append((date, game_id))
+                continue
+            yield date, game_id, result
+
+    def _results_by_date(self, games: Deque[Tuple], failures: List[Tuple]) -> Iterator[Tuple[str, List]]:
+        """Yields (date, task results of its games) in schedule order, skipping failed games
+
+        A date's games are adjacent in the schedule, so a date is complete as soon as its own games are, without
+        waiting on the first game of the next date like groupby over the results would.
+
+        Args:
+            games: queue of (date, game id, task future) from _submit_games
+            failures: (date, game id) of every failed game is appended here, the task already logged why
+        """
+        while games:
+            date = games[0][0]
+            date_games = deque()
+            while games and games[0][0] == date:
+                date_games.append(games.popleft())
+            yield date, [result for _, _, result in self._results(date_games, failures)]
+
+    def _fetch_game(self, date: str, game_id) -> Dict:
+        """Fetches a game's boxscore, date is unused but keeps the signature of _crawl_game
+
+        Args:
+            date: date of the game
+            game_id: game id
+
+        Returns:
+            boxscore of the game
+        """
+        try:
+            return self.api.boxscore(game_id)
+        except Exception:
+            LOG.exception('Failed to fetch game=%s on %s', game_id, date)
+            raise
+
+    def _crawl_game(self, date: str, game_id) -> None:
+        """Fetches a game's boxscore and stores its player data as csv
+
+        Args:
+            date: date of the game
+            game_id: game id
+        """
+        try:
+            self._store_game_csv(date, game_id)
+        except Exception:
+            LOG.exception('Failed to crawl game=%s on %s', game_id, date)
+            raise
+
+    def _store_game_csv(self, date: str, game_id) -> None:
+        """Fetches a game's boxscore and stores its player data as csv, failures are left to _crawl_game"""
+        players = self._player_rows(self._skaters(self.api.boxscore(game_id)))
+        if not players:
+            LOG.warning('No skaters in game=%s on %s (not played yet?), skipping', game_id, date)
+            return
+        # encode straight into the upload buffer instead of copying a finished str into bytes
+        csv_buffer = BytesIO()
+        text_buffer = TextIOWrapper(csv_buffer, encoding='utf-8', newline='')
+        self._write_csv(players, text_buffer)
+        text_buffer.detach()  # flushes and leaves csv_buffer open
+        self.storage.store_game(key=StorageKey(date, game_id), game_data=csv_buffer)
+
+    def _store_date(self, date: str, rows: List[Dict]) -> None:
+        """Stores the player data of all games of a date as one parquet object
+
+        Args:
+            date: date of the games
+            rows: List of flat player rows
+        """
+        if not rows:
+            LOG.warning('No skaters in any game on %s (not played yet?), skipping', date)
+            return
+        parquet_buffer = BytesIO()
+        self._write_parquet(rows, parquet_buffer)
+        self.storage.store_game(key=StorageKey(date, fmt='parquet'), game_data=parquet_buffer)
 
     def crawl(self, start_date: datetime, end_date: datetime) -> None:
         """Fetches and stores all game data and player data for a specified date range
@@ -196,21 +633,60 @@ class Crawler:
         # TODO ignore goalies (players with "goalieStats")
         # TODO output to S3 should be a csv that matches the schema of utils/create_games_stats
 
-        try:
-            schedule = self.api.schedule(start_date=start_date, end_date=end_date)
-        except Exception as err:
-            raise Exception(f'Failed to get schedule for start_date={start_date}, end_date={end_date}')
+        # fetching and uploading are both network bound, so games are submitted to the pool as soon as their date
+        # arrives from the schedule and each worker carries its game through to storage
+        parquet = self.output_format == 'parquet'
+        task = self._fetch_game if parquet else self._crawl_game
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor, \
+                ThreadPoolExecutor(max_workers=self.UPLOAD_WORKERS) as upload_executor:
+            try:
+                games = self._submit_games(executor, start_date, end_date, task)
+            except Exception as err:
+                raise Exception(f'Failed to get schedule for start_date={start_date}, end_date={end_date}') from err
+
+            # every game runs even when some fail, the failures are logged by the tasks and summed up at the end
+            total = len(games)
+            failures = []
+            if parquet:
+                # one object per date
+                stored = []
+                for date, boxscores in self._results_by_date(games, failures):
+                    rows = [row for game_data in boxscores for row in self._player_rows(self._skaters(game_data))]
+                    if any(failed_date == date for failed_date, _ in failures):
+                        LOG.error('Not storing %s, some of its games failed', date)
+                        continue
+                    stored.append((date, upload_executor.submit(self._store_date, date, rows)))
+                for date, future in stored:
+                    try:
+                        future.result()
+                    except Exception:
+                        LOG.exception('Failed to store %s', date)
+                        failures.append((date, None))
+            else:
+                for _ in self._results(games, failures):
+                    pass
+
+        if failures:
+            # (date, None) marks a date whose parquet object failed to store
+            raise Exception(f'Failed to crawl start_date={start_date}, end_date={end_date}, {len(failures)} failures '
+                            f'across {total} games (date, game id): {failures}')
+
+
+def _parse_crawl_date(value: str) -> datetime:
+    """Parses a YYYY-MM-DD date into a naive midnight datetime
+
+    fromisoformat also accepts forms like 20200804, times or utc offsets, so the value must render back to itself.
 
-        schedule_dates = schedule.get('dates')
+    Args:
+        value: date as YYYY-MM-DD
 
-        for schedule_date in schedule_dates:
-            LOG.info(f'Fetching games from {schedule_date}')
-            for game in schedule_date.get('games'):
-                game_data = self.api.boxscore(game.get('gamePk'))
-                game_data_df = self.create_game_stats(game_data)
-                csv_buffer = StringIO()
-                game_data_df.to_csv(csv_buffer, na_rep=None)
-                self.storage.store_game(key=StorageKey(game['gamePk']), game_data=csv_buffer.getvalue())
+    Returns:
+        Parsed datetime
+    """
+    parsed = datetime.fromisoformat(value)
+    if parsed.strftime('%Y-%m-%d') != value:
+        raise ValueError(f'Expected YYYY-MM-DD, got {value}')
+    return parsed
 
 
 def parse_crawl_args(start_date: str, end_date: str) -> Tuple[str, str]:
@@ -223,40 +699,42 @@ def parse_crawl_args(start_date: str, end_date: str) -> Tuple[str, str]:
     Returns:
         Formatted datetimes
     """
-    datetime_format = '%Y-%m-%d'
-
     try:
-        start_date = datetime.strptime(start_date, datetime_format)
+        start_date = _parse_crawl_date(start_date)
     except ValueError as error:
-        raise ValueError(f'ValueError invalid start_date. Use value like 2020-08-04') from error
+        raise ValueError('ValueError invalid start_date. Use value like 2020-08-04') from error
     try:
-        end_date = datetime.strptime(end_date, datetime_format)
+        end_date = _parse_crawl_date(end_date)
     except ValueError as error:
-        raise ValueError(f'Invalid start_date. Use value like 2020-08-04') from error
+        raise ValueError('Invalid end_date. Use value like 2020-08-04') from error
 
     if start_date >= end_date:
-        raise ValueError(f'start_date must be less than end_date')
+        raise ValueError('start_date must be less than end_date')
     return start_date, end_date
 
 
 def main():
     """Grabs NHL data for a specified date range and stores to simulated S3 bucket"""
-    import os
     import argparse
     parser = argparse.ArgumentParser(description='NHL Stats crawler')
     # TODO what arguments are needed to make this thing run,  if any?
     parser.add_argument('--start_date', type=str, help='YYYY-MM-DD', default='2020-08-04')  # TODO remove default
     parser.add_argument('--end_date', type=str, help='YYYY-MM-DD', default='2020-08-05')  # TODO remove default
+    parser.add_argument('--format', choices=Crawler.FORMATS, default='csv',
+                        help='csv writes one object per game, parquet one object per date')
     args = parser.parse_args()
     start_date, end_date = parse_crawl_args(args.start_date, args.end_date)
     dest_bucket = os.environ.get('DEST_BUCKET', 'output')
 
-    api = NHLApi()
-    s3client = boto3.client('s3', config=Config(signature_version='s3v4'),
-                            endpoint_url=os.environ.get('S3_ENDPOINT_URL'))
+    max_workers = 16
+    # every crawler thread uploads through this one client, so its pool has to cover them all or
+    # connections get discarded after each upload
+    s3config = Config(signature_version='s3v4', max_pool_connections=max_workers + Crawler.UPLOAD_WORKERS)
+    s3client = boto3.client('s3', config=s3config, endpoint_url=os.environ.get('S3_ENDPOINT_URL'))
     storage = Storage(dest_bucket, s3client)
-    crawler = Crawler(api, storage)
-    crawler.crawl(start_date, end_date)
+    with NHLApi(cache_dir=os.environ.get('NHL_CACHE_DIR')) as api:
+        crawler = Crawler(api, storage, max_workers=max_workers, output_format=args.format)
+        crawler.crawl(start_date, end_date)
 
 
 if __name__ == '__main__':
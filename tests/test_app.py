@@ -1,15 +1,23 @@
+import hashlib
 import json
+from collections import deque
 from datetime import datetime
+from io import BytesIO, StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Event
 from unittest import TestCase
 
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 import boto3
+import pyarrow.parquet as pq
 from botocore.config import Config
+from botocore.exceptions import ClientError
 
-from nhldata.app import Crawler, Storage
+from nhldata.app import Crawler, Storage, StorageKey
 
-from nhldata.app import NHLApi, parse_crawl_args
+from nhldata.app import NHLApi, RateLimiter, _api_date, _column_name, parse_crawl_args
 
 
 class CrawlerTest(TestCase):
@@ -37,17 +45,217 @@ class CrawlerTest(TestCase):
         mock_api = mock_api.start()
         mock_api.return_value = self.boxscore
 
-        mock_crawler = patch.object(target=Crawler, attribute='create_game_stats')
+        mock_crawler = patch.object(target=Crawler, attribute='_skaters')
         mock_crawler = mock_crawler.start()
+        self.addCleanup(patch.stopall)
 
         # Test
-        self.crawler.crawl(start_date=start_date, end_date=end_date)
+        self.crawler.crawl(start_date=start_datetime, end_date=end_datetime)
 
         # Verify
-        mock_schedule.assert_called_once_with(start_date=start_date, end_date=end_date)
-        mock_api.assert_called_once_with(self.gamePK)
+        mock_schedule.assert_called_once_with(start_date=start_datetime, end_date=end_datetime)
+        mock_api.assert_called_once_with(self.gamePk)
         mock_crawler.assert_called_once_with(self.boxscore)
 
+    def test_get(self):
+        # Set Up
+        mock_get = patch.object(target=self.api._session, attribute='get').start()
+        self.addCleanup(patch.stopall)
+        mock_get.return_value.content = open('resources/boxscore.json', 'rb').read()
+
+        # Test
+        actual_boxscore = self.api.boxscore(self.gamePk)
+
+        # Verify
+        mock_get.assert_called_once_with(f'{self.api.base}/game/{self.gamePk}/boxscore', params=None, timeout=60)
+        assert actual_boxscore == self.boxscore
+
+    def test_iter_schedule_dates(self):
+        # Set Up
+        start_date, end_date = parse_crawl_args('2020-08-01', '2020-08-20')
+        mock_schedule = patch.object(target=NHLApi, attribute='schedule').start()
+        self.addCleanup(patch.stopall)
+        mock_schedule.side_effect = lambda start_date, end_date: {'dates': [{'date': start_date.strftime('%Y-%m-%d')}]}
+
+        # Test
+        actual_dates = list(self.api.iter_schedule_dates(start_date, end_date, chunk_days=7))
+
+        # Verify
+        # windows are fetched concurrently, so the calls can land in any order
+        assert sorted([call.kwargs for call in mock_schedule.call_args_list], key=lambda kw: kw['start_date']) == [
+            {'start_date': datetime(2020, 8, 1), 'end_date': datetime(2020, 8, 7)},
+            {'start_date': datetime(2020, 8, 8), 'end_date': datetime(2020, 8, 14)},
+            {'start_date': datetime(2020, 8, 15), 'end_date': datetime(2020, 8, 20)},
+        ]
+        assert [d['date'] for d in actual_dates] == ['2020-08-01', '2020-08-08', '2020-08-15']
+
+    def test_get_cached(self):
+        # Set Up
+        cache_dir = TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        api = NHLApi(cache_dir=cache_dir.name)
+        mock_get = patch.object(target=api._session, attribute='get').start()
+        self.addCleanup(patch.stopall)
+        responses = {api._schedule_url: open('resources/test_schedule.json', 'rb').read(),
+                     api._boxscore_tmpl % self.gamePk: open('resources/boxscore.json', 'rb').read()}
+        mock_get.side_effect = lambda url, **kwargs: MagicMock(content=responses[url])
+        start_date, end_date = parse_crawl_args('2020-08-04', '2020-08-05')
+
+        # Test
+        api.schedule(start_date, end_date)
+        api.schedule(start_date, end_date)
+        api.boxscore(self.gamePk)
+        actual_boxscore = api.boxscore(self.gamePk)
+
+        # Verify
+        assert mock_get.call_count == 2  # past schedule and final game are both served from the cache
+        assert actual_boxscore == self.boxscore
+
+    def test_get_not_cached(self):
+        # Set Up
+        cache_dir = TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        api = NHLApi(cache_dir=cache_dir.name)
+        mock_get = patch.object(target=api._session, attribute='get').start()
+        self.addCleanup(patch.stopall)
+        mock_get.return_value.content = open('resources/test_schedule.json', 'rb').read()
+        today = datetime.now()
+
+        # Test
+        api.schedule(today, today)
+        api.schedule(today, today)
+        api.boxscore(2019030043)  # never seen as final in a schedule
+        api.boxscore(2019030043)
+
+        # Verify
+        assert mock_get.call_count == 4
+        assert list(Path(cache_dir.name).iterdir()) == []
+
+    @patch('nhldata.app.time.sleep')
+    def test_rate_limiter(self, mock_sleep):
+        # Set Up
+        limiter = RateLimiter(rate=10)
+
+        # Test
+        for _ in range(15):
+            limiter.acquire()
+
+        # Verify
+        assert mock_sleep.call_count == 5
+        assert 0.4 < mock_sleep.call_args.args[0] <= 0.5
+
+    def test_crawl_csv_output(self):
+        # Set Up
+        start_datetime, end_datetime = parse_crawl_args('2020-08-04', '2020-08-05')
+        schedule = json.load(open('resources/test_schedule.json'))
+        patch.object(target=NHLApi, attribute='schedule', return_value=schedule).start()
+        patch.object(target=NHLApi, attribute='boxscore', return_value=self.boxscore).start()
+        self.addCleanup(patch.stopall)
+        storage = MagicMock()
+        crawler = Crawler(self.api, storage)
+
+        # Test
+        crawler.crawl(start_date=start_datetime, end_date=end_datetime)
+
+        # Verify
+        stored = storage.store_game.call_args.kwargs
+        rows = stored['game_data'].getvalue().decode().splitlines()
+        assert stored['key'].key() == f'date=2020-08-04/game={self.gamePk}.csv'
+        assert rows[0].startswith('player_jerseyNumber,side,')  # no index column
+        assert 'None' not in rows[1] and 'nan' not in rows[1]  # a scratched player without skaterStats
+        assert rows[1].endswith(',,,')
+
+    def test_results(self):
+        # Set Up
+        futures = [MagicMock(), MagicMock()]
+        futures[0].result.return_value = self.boxscore
+        games = deque([('2020-08-04', self.gamePk, futures[0]), ('2020-08-05', 2019030043, futures[1])])
+
+        # Test
+        results = self.crawler._results(games, [])
+        actual_first = next(results)
+
+        # Verify
+        assert actual_first == ('2020-08-04', self.gamePk, self.boxscore)
+        assert len(games) == 1  # consumed futures are dropped so their boxscores can be freed
+
+    def test_crawl_parquet_output(self):
+        # Set Up
+        start_datetime, end_datetime = parse_crawl_args('2020-08-04', '2020-08-06')
+        schedule = {'dates': [
+            {'date': '2020-08-04', 'games': [{'gamePk': 2019030042}, {'gamePk': 2019030043}]},
+            {'date': '2020-08-05', 'games': []},
+            {'date': '2020-08-06', 'games': [{'gamePk': 2019030044}]},
+        ]}
+        patch.object(target=NHLApi, attribute='schedule', return_value=schedule).start()
+        patch.object(target=NHLApi, attribute='boxscore',
+                     side_effect=lambda game_id: json.load(open('resources/boxscore.json'))).start()
+        self.addCleanup(patch.stopall)
+        skaters = len(self.crawler._skaters(self.boxscore))
+        storage = MagicMock()
+        crawler = Crawler(self.api, storage, output_format='parquet')
+
+        # Test
+        crawler.crawl(start_date=start_datetime, end_date=end_datetime)
+
+        # Verify
+        stored = {call.kwargs['key'].key(): call.kwargs['game_data'] for call in storage.store_game.call_args_list}
+        assert sorted(stored) == ['date=2020-08-04/players.parquet', 'date=2020-08-06/players.parquet']
+        for key, expected_rows in (('date=2020-08-04/players.parquet', 2 * skaters),
+                                   ('date=2020-08-06/players.parquet', skaters)):
+            stored[key].seek(0)
+            assert pq.read_table(stored[key]).num_rows == expected_rows
+
+    def test_crawl_parquet_uploads_overlap_fetches(self):
+        # Set Up
+        start_datetime, end_datetime = parse_crawl_args('2020-08-04', '2020-08-05')
+        schedule = {'dates': [{'date': '2020-08-04', 'games': [{'gamePk': 1}]},
+                              {'date': '2020-08-05', 'games': [{'gamePk': 2}]}]}
+        patch.object(target=NHLApi, attribute='schedule', return_value=schedule).start()
+        first_date_stored = Event()
+
+        def boxscore(game_id):
+            # the last fetch only finishes once the first date is uploaded, which needs a pool of its own
+            if game_id == 2:
+                assert first_date_stored.wait(timeout=5)
+            return json.load(open('resources/boxscore.json'))
+        patch.object(target=NHLApi, attribute='boxscore', side_effect=boxscore).start()
+        self.addCleanup(patch.stopall)
+        storage = MagicMock()
+        storage.store_game.side_effect = lambda key, game_data: first_date_stored.set()
+        crawler = Crawler(self.api, storage, max_workers=1, output_format='parquet')
+
+        # Test
+        crawler.crawl(start_date=start_datetime, end_date=end_datetime)
+
+        # Verify
+        assert storage.store_game.call_count == 2
+
+    def test_crawl_reports_every_failure(self):
+        # Set Up
+        start_datetime, end_datetime = parse_crawl_args('2020-08-04', '2020-08-05')
+        schedule = {'dates': [{'date': '2020-08-04', 'games': [{'gamePk': game_id} for game_id in range(1, 7)]}]}
+        patch.object(target=NHLApi, attribute='schedule', return_value=schedule).start()
+
+        def boxscore(game_id):
+            if game_id % 2:
+                raise RuntimeError(f'boom {game_id}')
+            return json.load(open('resources/boxscore.json'))
+        patch.object(target=NHLApi, attribute='boxscore', side_effect=boxscore).start()
+        self.addCleanup(patch.stopall)
+        storage = MagicMock()
+        crawler = Crawler(self.api, storage)
+
+        # Test
+        with self.assertLogs('nhldata.app', level='ERROR') as logs, self.assertRaises(Exception) as raised:
+            crawler.crawl(start_date=start_datetime, end_date=end_datetime)
+
+        # Verify
+        assert storage.store_game.call_count == 3
+        assert '3 failures across 6 games' in str(raised.exception)
+        for game_id in (1, 3, 5):
+            assert any(f'game={game_id} on 2020-08-04' in line for line in logs.output)
+
     def test_create_game_stats(self):
         # Set Up
          # Test
@@ -70,6 +278,104 @@ class CrawlerTest(TestCase):
                 assert col.split('_')[0] == 'player'
             assert '.' not in col
 
+    def test_write_csv(self):
+        # Set Up
+        players = [{'player_person_id': 1, 'side': 'home'},
+                   {'player_person_id': 2, 'side': 'away', 'player_stats_skaterStats_goals': 1}]
+        csv_buffer = StringIO()
+
+        # Test
+        self.crawler._write_csv(players, csv_buffer)
+
+        # Verify
+        assert csv_buffer.getvalue() == ('player_person_id,side,player_stats_skaterStats_goals\n'
+                                         '1,home,\n'
+                                         '2,away,1\n')
+
+    def test_crawl_game_without_skaters(self):
+        # Set Up
+        for team in self.boxscore['teams'].values():
+            team['players'] = {}
+        patch.object(target=NHLApi, attribute='boxscore', return_value=self.boxscore).start()
+        self.addCleanup(patch.stopall)
+        storage = MagicMock()
+        crawler = Crawler(self.api, storage)
+
+        # Test
+        crawler._crawl_game('2020-08-04', self.gamePk)
+
+        # Verify
+        storage.store_game.assert_not_called()
+
+    def test_write_parquet(self):
+        # Set Up
+        players = self.crawler._player_rows(self.crawler._skaters(self.boxscore))
+        parquet_buffer = BytesIO()
+
+        # Test
+        self.crawler._write_parquet(players, parquet_buffer)
+
+        # Verify
+        parquet_buffer.seek(0)
+        actual_table = pq.read_table(parquet_buffer)
+        assert actual_table.num_rows == len(players)
+        assert 'side' in actual_table.column_names
+        assert 'player_stats_skaterStats_goals' in actual_table.column_names
+
+    def test_store_game(self):
+        # Set Up
+        s3client = MagicMock()
+        s3client.head_object.side_effect = ClientError({'Error': {'Code': '404'}}, 'HeadObject')
+        storage = Storage('data-bucket', s3client)
+
+        # Test
+        storage.store_game(StorageKey('2020-08-04', self.gamePk), BytesIO(b'player_person_id'))
+
+        # Verify
+        s3client.upload_fileobj.assert_called_once()
+
+    def test_store_game_head_forbidden(self):
+        # Set Up
+        s3client = MagicMock()
+        s3client.head_object.side_effect = ClientError({'Error': {'Code': '403'}}, 'HeadObject')
+        storage = Storage('data-bucket', s3client)
+
+        # Test
+        storage.store_game(StorageKey('2020-08-04', self.gamePk), BytesIO(b'player_person_id'))
+
+        # Verify
+        s3client.upload_fileobj.assert_called_once()
+
+    def test_store_game_already_stored(self):
+        # Set Up
+        s3client = MagicMock()
+        s3client.head_object.return_value = {'ETag': f'"{hashlib.md5(b"player_person_id").hexdigest()}"'}
+        storage = Storage('data-bucket', s3client)
+
+        # Test
+        storage.store_game(StorageKey('2020-08-04', self.gamePk), BytesIO(b'player_person_id'))
+
+        # Verify
+        s3client.upload_fileobj.assert_not_called()
+
+    def test_storage_key(self):
+        assert StorageKey('2020-08-04', 2019030042).key() == 'date=2020-08-04/game=2019030042.csv'
+        assert StorageKey('2020-08-04', fmt='parquet').key() == 'date=2020-08-04/players.parquet'
+
+    def test_api_date(self):
+        assert _api_date('2020-08-04') == '2020-08-04'
+        assert _api_date('2020-8-4') == '2020-08-04'
+        with self.assertRaises(expected_exception=ValueError):
+            _api_date(None)
+        with self.assertRaises(expected_exception=ValueError):
+            _api_date('2020-08-04T16:00:00Z')
+
+    def test_column_name(self):
+        assert _column_name('', 'side') == 'side'
+        assert _column_name('', 'person') == 'player_person'
+        assert _column_name('player_person', 'fullName') == 'player_person_fullName'
+        assert _column_name('player_stats', 'skater.Stats') == 'player_stats_skater_Stats'
+
     def test_parse_crawl_args(self):
         # Set Up
         start_date = '2020-08-04'
@@ -88,6 +394,13 @@ class CrawlerTest(TestCase):
         # Test invalid end_date
         with self.assertRaises(expected_exception=ValueError):
             parse_crawl_args(start_date='2020-01-12', end_date='2022-ab-01')
+        # Test non YYYY-MM-DD iso formats
+        with self.assertRaises(expected_exception=ValueError):
+            parse_crawl_args(start_date='20200804', end_date='2020-08-05')
+        with self.assertRaises(expected_exception=ValueError):
+            parse_crawl_args(start_date='2020-08-04T10:00', end_date='2020-08-04T11:00')
+        with self.assertRaises(expected_exception=ValueError):
+            parse_crawl_args(start_date='2020-08-04T00:00+05:00', end_date='2020-08-05')
         # Test start_date > end_date
         with self.assertRaises(expected_exception=ValueError):
             parse_crawl_args(start_date='2022-01-12', end_date='2020-01-01')